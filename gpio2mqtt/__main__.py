@@ -1,26 +1,55 @@
 """
 Main entry point of the GPIO2MQTT application.
 """
+from __future__ import annotations
+
 import argparse
 import logging
-import logging.config
+import logging.handlers
 import os
+import pickle
+import queue
 import signal
+import stat
 import sys
 import threading
 import time
-import yaml
+from typing import Final, TYPE_CHECKING
 
 import sdnotify
 
 from . import GPIO2MQTT_VERSION
 from .config import ConfigParser
-from .device_pulse_counter import PulseCounter, ElectricityPulseMeter
-from .devices import Device, Devices
-from .mqtt import MqttConnection
+
+# devices and mqtt modules (and the libraries they use) are imported lazily, not needed for --version and --help
+if TYPE_CHECKING:
+    from .devices import Device, Devices
 
 _LOGGER = logging.getLogger(__name__)
 
+_LOOP_INTERVAL_SECONDS: Final[float] = 1.0
+
+
+_LOGGING_FORMATTERS: Final[dict[str, dict]] = {
+    "standard" : {
+        "format" : "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    }
+}
+_LOGGING_HANDLERS: Final[dict[str, dict]] = {
+    "console" : {
+        "class" : "logging.StreamHandler",
+        "formatter" : "standard",
+        "stream" : sys.stdout
+    },
+    "file" : {
+        "class" : "logging.handlers.RotatingFileHandler",
+        "formatter" : "standard",
+        "filename" : os.path.abspath("gpio2mqtt.log"),
+        "maxBytes" : 1_000_000,
+        "backupCount" : 5
+    }
+}
+
 
 def _parse_args() -> argparse.Namespace:
     argparser = argparse.ArgumentParser(prog = "gpio2mqtt")
@@ -31,47 +60,150 @@ def _parse_args() -> argparse.Namespace:
     return argparser.parse_args()
 
 
-def _setup_logging(logconsole: bool, logdebug: bool) -> None:
+def _setup_logging(logconsole: bool, logdebug: bool) -> logging.handlers.QueueListener:
+    from logging import config as logging_config # pylint: disable=import-outside-toplevel
+
+    # only the used handler is configured, dictConfig creates all configured handlers (and opens the log file)
+    handler_name: str = "console" if logconsole else "file"
     dict_conf: dict = {
         "version" : 1,
         "disable_existing_loggers" : False,
-        "formatters" : {
-            "standard" : {
-                "format" : "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
-            }
-        },
-        "handlers" : {
-            "console" : {
-                "class" : "logging.StreamHandler",
-                "formatter" : "standard",
-                "stream" : sys.stdout
-            },
-            "file" : {
-                "class" : "logging.handlers.RotatingFileHandler",
-                "formatter" : "standard",
-                "filename" : os.path.abspath("gpio2mqtt.log"),
-                "maxBytes" : 1_000_000,
-                "backupCount" : 5
-            }
-        },
+        "formatters" : _LOGGING_FORMATTERS,
+        # copy the handler config, dictConfig modifies it
+        "handlers" : { handler_name : dict(_LOGGING_HANDLERS[handler_name]) },
         "root" : {
             "level" : logging.DEBUG if logdebug else logging.INFO,
-            "handlers" : [ "console" if logconsole else "file" ]
+            "handlers" : [ handler_name ]
         }
     }
-    logging.config.dictConfig(dict_conf)
+    logging_config.dictConfig(dict_conf)
+
+    # move the actual handler i/o to a background thread to not block the main loop and the gpio callbacks
+    root_logger: logging.Logger = logging.getLogger()
+    handlers: list[logging.Handler] = list(root_logger.handlers)
+    # SimpleQueue.put is reentrant, signal handlers may log while the main thread is inside a put
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level = True)
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    return listener
+
+
+# stat based key of a configuration file, used to detect changes
+ConfigFileKey = tuple[int, int]
+
+# the already included files (all dependencies) of a configuration file
+ConfigFileIncludes = dict[str, ConfigFileKey]
+
+
+def _get_config_file_key(file_stat: os.stat_result) -> ConfigFileKey:
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def _get_config_cache_header(file_stat: os.stat_result) -> bytes:
+    return f"{file_stat.st_mtime_ns}:{file_stat.st_size}\n".encode("ascii")
+
+
+def _is_config_includes_unchanged(includes: ConfigFileIncludes) -> bool:
+    try:
+        return all(_get_config_file_key(os.stat(file)) == key for file, key in includes.items())
+    except OSError:
+        return False
+
+
+def _read_config_cache(cache_file: str, file_stat: os.stat_result) -> tuple[any, ConfigFileIncludes] | None:
+    # returns None if there is no usable cache for the configuration file with the given stat
+    try:
+        with open(cache_file, "rb") as stream:
+            cache_stat: os.stat_result = os.fstat(stream.fileno())
+            if cache_stat.st_uid != file_stat.st_uid or cache_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                # do not trust a cache file that may have been written by someone else
+                _LOGGER.warning("Ignoring configuration cache file '%s' due to owner or permissions", cache_file)
+                return None
+            if stream.readline() != _get_config_cache_header(file_stat):
+                return None
+            raw, includes = pickle.load(stream)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, TypeError, ValueError) as error:
+        _LOGGER.warning("Reading configuration cache file '%s' failed: %s", cache_file, error)
+        return None
+    # the cached content is outdated if any of the included files has been changed
+    return (raw, includes) if _is_config_includes_unchanged(includes) else None
+
+
+def _write_config_cache(cache_file: str, file_stat: os.stat_result, raw: any, includes: ConfigFileIncludes) -> None:
+    tmp_file: str = cache_file + ".tmp"
+    try:
+        with open(tmp_file, "wb") as stream:
+            os.fchmod(stream.fileno(), stat.S_IMODE(file_stat.st_mode) & ~(stat.S_IWGRP | stat.S_IWOTH))
+            stream.write(_get_config_cache_header(file_stat))
+            stream.write(pickle.dumps((raw, includes), protocol = 5))
+        os.replace(tmp_file, cache_file)
+    except OSError as error:
+        _LOGGER.warning("Writing configuration cache file '%s' failed: %s", cache_file, error)
+
+
+def _parse_config_yaml(file: str, visited: frozenset[str]) -> tuple[any, ConfigFileIncludes]:
+    # PyYAML is not needed if the configuration cache is used
+    import yaml # pylint: disable=import-outside-toplevel
+
+    includes: ConfigFileIncludes = {}
+
+    def include_constructor(loader: yaml.Loader, node: yaml.Node) -> any:
+        # include file names are relative to the including file
+        include_file: str = os.path.abspath(os.path.join(os.path.dirname(file), loader.construct_scalar(node)))
+        if include_file in visited:
+            raise yaml.constructor.ConstructorError(None, None,
+                    f"include of '{include_file}' is cyclic", node.start_mark)
+        try:
+            # record the key the include has been loaded for, a later stat may already see a newer file
+            include_raw, include_includes, includes[include_file] = _load_config_file(include_file, visited)
+        except OSError as error:
+            raise yaml.constructor.ConstructorError(None, None,
+                    f"include of '{include_file}' failed: {error}", node.start_mark) from error
+        includes.update(include_includes)
+        return include_raw
+
+    # use the LibYAML based loader if PyYAML has been built with it, it is much faster than the pure python loader
+    class Loader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)): # pylint: disable=too-many-ancestors
+        """
+        Safe loader with support for the !include tag.
+        """
+    Loader.add_constructor("!include", include_constructor)
+
+    try:
+        with open(file, "rb") as stream:
+            return yaml.load(stream, Loader = Loader), includes
+    except yaml.YAMLError as error:
+        raise ValueError(str(error)) from error
+
+
+def _load_config_file(file: str, visited: frozenset[str]) -> tuple[any, ConfigFileIncludes, ConfigFileKey]:
+    # loads the given (absolute) file from its cache, if valid, or parses it and updates its cache
+    # also returns the key of the file stat the content has been loaded for
+    file_stat: os.stat_result = os.stat(file)
+    cache_file: str = file + ".cache"
+    result: tuple[any, ConfigFileIncludes] = _read_config_cache(cache_file, file_stat)
+    if result is None:
+        result = _parse_config_yaml(file, visited | { file })
+        _write_config_cache(cache_file, file_stat, *result)
+    else:
+        _LOGGER.debug("Using configuration cache file '%s'", cache_file)
+    return *result, _get_config_file_key(file_stat)
 
 
 def _load_config_yaml(file: str) -> ConfigParser:
     _LOGGER.info("Loading configuration file '%s'", file)
     result = None
     try:
-        with open(file, "r", encoding = "utf8") as stream:
-            raw = yaml.safe_load(stream)
+        raw, _, _ = _load_config_file(os.path.abspath(file), frozenset())
         result = ConfigParser(raw, _LOGGER)
     except FileNotFoundError:
         _LOGGER.critical("Configuration file '%s' not found", file)
-    except yaml.YAMLError as error:
+    except ValueError as error:
         _LOGGER.critical("Configuration file '%s' invalid: %s", file, error)
     return result
 
@@ -79,6 +211,7 @@ def _load_config_yaml(file: str) -> ConfigParser:
 def _get_device_classes() -> list[type[Device]]:
     # device classes must be passes as argument to Devices instance to break cyclic imports
     # for now, there is no need to dynamically scan for available device classes
+    from .device_pulse_counter import PulseCounter, ElectricityPulseMeter # pylint: disable=import-outside-toplevel
     return [ PulseCounter, ElectricityPulseMeter ]
 
 
@@ -99,14 +232,24 @@ def _setup_signals(exit_event: threading.Event, devices: Devices):
 
 
 def _loop(exit_event: threading.Event, devices: Devices) -> None:
+    # invoke devices at a fixed rate of one tick per second, independent of the duration of a tick
+    deadline: float = time.monotonic()
     while not exit_event.is_set():
         try:
             devices.loop()
-            time.sleep(1)
+            deadline += _LOOP_INTERVAL_SECONDS
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                # tick took longer than the interval, do not try to catch up missed ticks
+                deadline = time.monotonic()
+            # wait on the event instead of sleeping to stop immediately on exit signals
+            elif exit_event.wait(remaining):
+                break
         except Exception as error: # pylint: disable=broad-exception-caught
             # try to recover from an unexpected exception by sleeping some time ...
             _LOGGER.error("Something went wrong, sleeping 60 seconds: %s", error)
-            time.sleep(60)
+            exit_event.wait(60.0)
+            deadline = time.monotonic()
 
 
 def main(config_file: str, validate_config: bool) -> int:
@@ -118,6 +261,9 @@ def main(config_file: str, validate_config: bool) -> int:
     Returns:
         int: the exit code
     """
+    from .devices import Devices # pylint: disable=import-outside-toplevel,redefined-outer-name
+    from .mqtt import MqttConnection # pylint: disable=import-outside-toplevel
+
     _LOGGER.info("Starting GPIO2MQTT version %s ...", GPIO2MQTT_VERSION)
 
     config: ConfigParser = _load_config_yaml(config_file)
@@ -154,9 +300,15 @@ def main(config_file: str, validate_config: bool) -> int:
     return 0
 
 
-# main entry point
-args: argparse.Namespace = _parse_args()
-_setup_logging(args.logconsole, args.logdebug)
+# main entry point, guarded to allow importing this module without starting the application
+if __name__ == "__main__":
+    args: argparse.Namespace = _parse_args()
+    # validation results are always logged to the console
+    log_listener: logging.handlers.QueueListener = _setup_logging(args.logconsole or args.validate, args.logdebug)
 
-exit_code: int = main(os.path.abspath("config.yaml"), args.validate)
-sys.exit(exit_code)
+    try:
+        exit_code: int = main(os.path.abspath("config.yaml"), args.validate)
+    finally:
+        # flush queued log records, also (and especially) if main failed
+        log_listener.stop()
+    sys.exit(exit_code)
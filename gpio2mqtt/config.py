@@ -3,7 +3,21 @@ Helper to access configuration dictionaries.
 """
 from logging import Logger
 import re
-from typing import Self
+import sys
+from typing import Final, Self
+
+
+# maximum length of string values to intern
+_INTERN_MAX_LENGTH: Final[int] = 64
+
+# values accepted as bool, PyYAML already converts unquoted true/false/yes/no/on/off to bool
+_BOOL_VALUES: Final[dict[bool | int | str, bool]] = {
+    True : True, False : False,
+    "true" : True, "false" : False,
+    "yes" : True, "no" : False,
+    "on" : True, "off" : False,
+    "1" : True, "0" : False
+}
 
 
 class ConfigParser:
@@ -27,7 +41,12 @@ class ConfigParser:
         """
         self._raw = raw
         self._logger = logger
-        self._base_key = base_key if base_key else ""
+        # the base key is either empty (root node) or ends with "." to be used directly as prefix for keys
+        if not base_key:
+            base_key = ""
+        elif not base_key.endswith("."):
+            base_key += "."
+        self._base_key = base_key
         self._parent_parser = parent_parser
         self._errors: int = 0
 
@@ -49,7 +68,7 @@ class ConfigParser:
     def base_key(self) -> str:
         """
         Returns:
-            str: the node base key, an empty string for the root node
+            str: the node base key ending with ".", an empty string for the root node
         """
         return self._base_key
 
@@ -78,19 +97,12 @@ class ConfigParser:
                     None if return_empty is False and dictionary contains no values for the sub node
         """
         node_raw = self._raw.get(key)
-        if node_raw is None and return_empty:
-            # node not found and should return empty
+        if not node_raw:
+            # empty or not existing node found
+            if not return_empty:
+                return None
             node_raw = {}
-        elif node_raw and not return_empty:
-            # empty node found and should return none instead
-            node_raw = None
-
-        result: Self = None
-        if node_raw is not None:
-            node_logger = logger if logger is not None else self._logger
-            node_base_key = (self._base_key + "." if self._base_key else "") + key + "."
-            result = ConfigParser(node_raw, node_logger, node_base_key, self)
-        return result
+        return type(self)(node_raw, logger if logger is not None else self._logger, self._base_key + key + ".", self)
 
 
     def get_list_parsers(self, key: str, logger: Logger = None) -> list[Self]:
@@ -107,16 +119,15 @@ class ConfigParser:
         result: list[Self] = []
         if list_raw:
             node_logger = logger if logger is not None else self._logger
-            list_base_key = (self._base_key + "." if self._base_key else "") + key
-            for idx, node_raw in enumerate(list_raw):
-                node_base_key = list_base_key + "[" + str(idx) + "]."
-                result.append(ConfigParser(node_raw, node_logger, node_base_key, self))
+            list_base_key = self._base_key + key
+            result = [ type(self)(node_raw, node_logger, f"{list_base_key}[{idx}].", self)
+                    for idx, node_raw in enumerate(list_raw) ]
         return result
 
 
     def get_str(
             self, key: str, mandatory: bool = False, default: str = None,
-            allowed: set[str] = None,
+            allowed: frozenset[str] = None,
             regex_pattern: str | re.Pattern[str] = None, regex_flags = 0
     ) -> str:
         """
@@ -127,10 +138,10 @@ class ConfigParser:
             key (str): the key for the value
             mandatory (bool, optional): True if the value is mandatory, False otherwise
             default (str, optional): the default value
-            allowed (set[str], optional): the allowed values, None for all values are allowed
+            allowed (frozenset[str], optional): the allowed values, None for all values are allowed
             regex_pattern (str | re.Pattern[str], optional):
                     the regualar expression pattern the value must match, None for no pattern check
-            regex_flags (int, optional): the regular expression flags, only used if regex_pattern is not None
+            regex_flags (int, optional): the regular expression flags, only used if regex_pattern is a string
         Returns:
             str: the string value or None
         """
@@ -141,12 +152,18 @@ class ConfigParser:
                 value = None
         else:
             if allowed is not None and value not in allowed:
-                self.error("Invalid value: %s%s: '%s' is not in %s", self._base_key, key, value, allowed)
-                value = None
-            if regex_pattern is not None and re.fullmatch(regex_pattern, value, regex_flags) is None:
-                self.error("Invalid value: %s%s: '%s' does not match regex pattern '%s'",
-                        self._base_key, key, value, regex_pattern)
+                self.error("Invalid value: %s%s: '%s' is not in %s", self._base_key, key, value, sorted(allowed))
                 value = None
+            elif regex_pattern is not None:
+                # re.compile returns compiled patterns as-is and caches the patterns compiled from strings
+                pattern: re.Pattern[str] = re.compile(regex_pattern, regex_flags)
+                if pattern.fullmatch(value) is None:
+                    self.error("Invalid value: %s%s: '%s' does not match regex pattern '%s'",
+                            self._base_key, key, value, pattern.pattern)
+                    value = None
+        if isinstance(value, str) and len(value) < _INTERN_MAX_LENGTH:
+            # short values like ids and types are repeated in topics and used for equality checks and as dict keys
+            value = sys.intern(value)
         return value
 
 
@@ -172,11 +189,12 @@ class ConfigParser:
                 self.error("Mandatory value missing: %s%s", self._base_key, key)
                 value = None
         else:
-            try:
-                value = bool(string)
-            except ValueError:
+            if isinstance(string, str):
+                value = _BOOL_VALUES.get(string.lower())
+            elif isinstance(string, (bool, int)):
+                value = _BOOL_VALUES.get(string)
+            if value is None:
                 self.error("Invalid value: %s%s: '%s' is not a bool", self._base_key, key, string)
-                value = None
         return value
 
 
@@ -242,17 +260,15 @@ class ConfigParser:
     def error(self, msg, *args) -> None:
         """
         Logs the given error message, if the logger of this instance is created with a logger.
-        Sets the errors flag of this instance and recursively in all parent instances, if any.
+        Sets the errors flag of this instance and of all parent instances, if any.
 
         Args:
             msg (_type_): the error message
         """
         if self._logger:
             self._logger.critical(msg, *args)
-        self._inc_errors()
-
-
-    def _inc_errors(self) -> None:
-        self._errors += 1
-        if self._parent_parser:
-            self._parent_parser._inc_errors() # pylint: disable=protected-access
+        # walk up the parent chain iteratively, sub node parsers must report errors of their own sub nodes too
+        parser: Self = self
+        while parser is not None:
+            parser._errors += 1 # pylint: disable=protected-access
+            parser = parser._parent_parser # pylint: disable=protected-access
@@ -1,9 +1,12 @@
 """
 Implementations of pulse counter devices.
 """
-import json
+from collections import deque
+from collections.abc import Callable
+import itertools
 import logging
-from threading import RLock
+import math
+from threading import Lock
 import time
 from typing import Final
 
@@ -12,13 +15,25 @@ import paho.mqtt.client as mqtt_client
 
 from .config import ConfigParser
 from .devices import Device
-from .mqtt import MqttConnection
+from .mqtt import MqttConnection, MqttConnectionOnMessage
 from . import utils
 
 _LOGGER = logging.getLogger(__name__)
 
 _INIT_MODE_MQTT: Final[str] = "mqtt"
+_INIT_MODES: Final[frozenset[str]] = frozenset({ "new", _INIT_MODE_MQTT })
 _INIT_WAIT_MAX_SECONDS: Final[int] = 10
+_TIMESTAMP_FORMAT_UNIX: Final[str] = "unix"
+_TIMESTAMP_FORMATS: Final[frozenset[str]] = frozenset({ "iso", _TIMESTAMP_FORMAT_UNIX })
+# energy and power are calculated in tenths with integer math, they are published with one decimal
+# power of one pulse in tenths of W: 1 / pulses_per_kwh kWh devided by hours (nanoseconds / 3_600_000_000_000),
+# multiplied by 1000 (kW -> W) and 10 (W -> tenths of W) => 36_000_000_000_000_000 / (pulses_per_kwh * nanoseconds)
+_POWER_TENTHS_DIVIDEND: Final[int] = 36_000_000_000_000_000
+
+# bound once to save the global and attribute lookups in loop and sensor callbacks
+_time = time.time
+_monotonic = time.monotonic
+_monotonic_ns = time.monotonic_ns
 
 
 class PulseCounter(Device):
@@ -27,6 +42,12 @@ class PulseCounter(Device):
     Publishes the total "count" and the corresponding "timestamp".
     """
 
+    __slots__ = ("_gpio_pin", "_active_high", "_sample_rate_hz", "_queue_len",
+            "_init_mode", "_publish_interval_seconds", "_timestamp_unix",
+            "_set_command_topic", "_set_command_handlers",
+            "_count", "_published_count", "_pulse_counter", "_pulse_mark", "_dirty", "_published_time",
+            "_sensor", "_on_sensor_pulse", "_log_pulses", "_initializing", "_lock")
+
 
     def __init__(self, device_config: ConfigParser, mqtt: MqttConnection) -> None:
         """
@@ -39,41 +60,70 @@ class PulseCounter(Device):
         super().__init__(device_config, mqtt)
         self._gpio_pin: int = device_config.get_int("gpio_pin", mandatory = True, min_value = 1, max_value = 40)
         self._active_high: bool = device_config.get_bool("active_high", mandatory = True)
-        self._init_mode: str = device_config.get_str("init_mode", default = "new", allowed = { "new", _INIT_MODE_MQTT })
+        # input is sampled and debounced by gpiozero, the callback is invoked on debounced edges only
+        self._sample_rate_hz: int = device_config.get_int("sample_rate_hz", default = 100,
+                min_value = 1, max_value = 1000)
+        self._queue_len: int = device_config.get_int("queue_len", default = 5, min_value = 1, max_value = 100)
+        self._init_mode: str = device_config.get_str("init_mode", default = "new", allowed = _INIT_MODES)
         self._publish_interval_seconds: int = device_config.get_int("publish_interval_seconds",
                 mandatory = True, default = 0, min_value = 0)
+        self._timestamp_unix: bool = device_config.get_str("timestamp_format", default = "iso",
+                allowed = _TIMESTAMP_FORMATS) == _TIMESTAMP_FORMAT_UNIX
+        # all set commands are received by a single subscription and dispatched by the last topic level
+        self._set_command_topic: str = self.state_topic + "/set/+"
+        self._set_command_handlers: dict[str, MqttConnectionOnMessage] = { "count" : self._on_set_count_message }
 
         self._count: int = None
         self._published_count: int = None
+        # pulses are counted lock free by the sensor callback, see _drain_pulses
+        self._pulse_counter: itertools.count = None
+        self._pulse_mark: int = None
+        # set lock free by the sensor callback, cleared by loop when there is no unpublished count left
+        self._dirty: bool = False
+        # monotonic time of the last publish, used for the publish interval only and not affected by clock adjustments
         self._published_time: float = None
 
         self._sensor = None
+        # sensor callback created on start, see _create_sensor_callback
+        self._on_sensor_pulse: Callable[[], None] = None
+        self._log_pulses: bool = False
         self._initializing: bool = False
-        self._lock: RLock = RLock()
+        self._lock: Lock = Lock()
 
 
     def start(self) -> None:
         with self._lock:
             _LOGGER.info("Starting %s with id %s", self.__class__.__name__, self.id)
+            # checked once, the log level is not changed at runtime
+            self._log_pulses = _LOGGER.isEnabledFor(logging.DEBUG)
             self._init_state()
             self._init_sensor()
             self._start_command_handler()
 
 
     def stop(self) -> None:
+        now: float = _time()
         with self._lock:
             self._stop_init_last_state()
             self._stop_command_handler()
             self._stop_sensor()
+            self._drain_pulses()
             if self._count > self._published_count:
                 # publish last state to miss as few counts as possible in case of a restart
-                self._publish_state(time.time())
+                self._publish_state(now)
             _LOGGER.info("Stopped %s with id %s", self.__class__.__name__, self.id)
 
 
     def loop(self) -> None:
+        if not self._initializing and not self._dirty:
+            # no pulse since the last publish, nothing to do
+            return
+        # get time before acquiring the lock to keep the critical section short
+        now: float = _monotonic()
+        if not self._initializing and now - self._published_time < self._publish_interval_seconds:
+            # nothing to publish before the interval has elapsed, no need to acquire the lock
+            return
         with self._lock:
-            now: float = time.time()
             diff_seconds: float = now - self._published_time
 
             if self._initializing and diff_seconds > _INIT_WAIT_MAX_SECONDS:
@@ -81,9 +131,16 @@ class PulseCounter(Device):
                 _LOGGER.debug("Waiting for last state timed out for %s with id %s", self.__class__.__name__, self.id)
                 self._stop_init_last_state()
 
+            # cleared before draining, a pulse counted after the drain sets it again
+            self._dirty = False
+            self._drain_pulses()
             if not self._initializing and self._count > self._published_count \
                     and diff_seconds >= self._publish_interval_seconds:
-                self._publish_state(now)
+                # wall clock time is needed for the published timestamp only
+                self._publish_state(_time())
+            if self._count > self._published_count:
+                # not published yet (still initializing or not connected), try again on next loop
+                self._dirty = True
 
 
     def get_count(self) -> int:
@@ -94,6 +151,7 @@ class PulseCounter(Device):
             int: the count
         """
         with self._lock:
+            self._drain_pulses()
             return self._count
 
 
@@ -105,19 +163,24 @@ class PulseCounter(Device):
             count (int): the count
             now (float, optional): the time related to the count, None to use now
         """
+        if now is None:
+            now = _time()
         with self._lock:
-            if now is None:
-                now = time.time()
+            # pulses counted so far are replaced by the given count
+            self._drain_pulses()
             self._count = count
             self._published_count = count
-            self._published_time = now
+            self._published_time = _monotonic()
             self._publish_state(now)
 
 
     def _init_state(self) -> None:
         self._count = 0
+        self._pulse_counter = itertools.count()
+        self._pulse_mark = -1
+        self._dirty = False
         self._published_count = 0
-        self._published_time = time.time()
+        self._published_time = _monotonic()
         if self._init_mode == _INIT_MODE_MQTT:
             self._initializing = True
             self._mqtt.add_message_handler(self.state_topic, self._on_init_last_state_message)
@@ -135,25 +198,31 @@ class PulseCounter(Device):
                 _LOGGER.info("Received last state message for %s with id %s: %s",
                         self.__class__.__name__, self.id, message.payload)
                 try:
-                    payload: dict = json.loads(message.payload)
+                    payload: dict = utils.json_loads(message.payload)
                     read_count: int = int(payload.get("count"))
-                    read_time: float = utils.parse_iso_timestamp_tz(payload.get("timestamp"))
+                    read_timestamp: str | int = payload.get("timestamp")
+                    read_time: float = float(read_timestamp) if isinstance(read_timestamp, (int, float)) \
+                            else utils.parse_iso_timestamp_tz(read_timestamp)
                     if read_count and read_time:
                         # message is valid, set last state but keep pulses counted since start
+                        self._drain_pulses()
                         self._count += read_count
                         self._published_count = read_count
-                        self._published_time = read_time
+                        # convert the wall clock time of the last state to monotonic time
+                        self._published_time = _monotonic() - (_time() - read_time)
                     else:
                         _LOGGER.error("Parsing last state message for %s with id %s failed: missing required values",
                                 self.__class__.__name__, self.id)
-                except (ValueError, json.JSONDecodeError) as error:
+                except ValueError as error:
                     _LOGGER.error("Parsing last state message for %s with id %s failed: %s",
                             self.__class__.__name__, self.id, error)
                 self._stop_init_last_state()
 
 
     def _init_sensor(self) -> None:
-        self._sensor = LineSensor(self._gpio_pin, pull_up = not self._active_high)
+        self._sensor = LineSensor(self._gpio_pin, pull_up = not self._active_high,
+                queue_len = self._queue_len, sample_rate = self._sample_rate_hz)
+        self._on_sensor_pulse = self._create_sensor_callback()
         self._sensor.when_line = self._on_sensor_pulse
 
 
@@ -163,10 +232,29 @@ class PulseCounter(Device):
             self._sensor = None
 
 
-    def _on_sensor_pulse(self) -> None:
-        with self._lock:
-            _LOGGER.debug("Input pulse for %s with id %s detected", self.__class__.__name__, self.id)
-            self._count += 1
+    def _create_sensor_callback(self) -> Callable[[], None]:
+        # the callback is invoked from the gpiozero thread, next() on itertools.count is atomic and needs no lock
+        # closure with locally bound references to save attribute lookups per pulse
+        # subclasses may wrap the returned callback to handle pulses in addition
+        count_pulse: Callable[[], int] = self._pulse_counter.__next__
+        device: PulseCounter = self
+        def on_sensor_pulse() -> None:
+            count_pulse()
+            device._dirty = True # pylint: disable=protected-access
+        if not self._log_pulses:
+            return on_sensor_pulse
+        def on_sensor_pulse_logged() -> None:
+            on_sensor_pulse()
+            _LOGGER.debug("Input pulse for %s with id %s detected", device.__class__.__name__, device.id)
+        return on_sensor_pulse_logged
+
+
+    def _drain_pulses(self) -> None:
+        # adds the pulses counted since the last drain to the count, must be invoked with the lock held
+        # each drain takes one value from the counter too, all other values since the last drain are pulses
+        mark: int = next(self._pulse_counter)
+        self._count += mark - self._pulse_mark - 1
+        self._pulse_mark = mark
 
 
     def mock_input(self) -> None:
@@ -174,18 +262,24 @@ class PulseCounter(Device):
 
 
     def _start_command_handler(self) -> None:
-        self._mqtt.add_message_handler(self.state_topic + "/set/count", self._on_set_count_message)
+        self._mqtt.add_message_handler(self._set_command_topic, self._on_set_command_message)
 
 
     def _stop_command_handler(self) -> None:
-        self._mqtt.remove_message_handler(self.state_topic + "/set/count", self._on_set_count_message)
+        self._mqtt.remove_message_handler(self._set_command_topic, self._on_set_command_message)
+
+
+    def _on_set_command_message(self, message: mqtt_client.MQTTMessage) -> None:
+        handler: MqttConnectionOnMessage = self._set_command_handlers.get(message.topic.rpartition("/")[2])
+        if handler is not None:
+            handler(message)
 
 
     def _on_set_count_message(self, message: mqtt_client.MQTTMessage) -> None:
         _LOGGER.info("Received set count command message for %s with id %s: %s",
                 self.__class__.__name__, self.id, message.payload)
         try:
-            read_count: int = int(message.payload.decode())
+            read_count: int = int(message.payload)
             if read_count:
                 self.set_count(read_count)
         except (ValueError) as error:
@@ -194,19 +288,26 @@ class PulseCounter(Device):
 
 
     def _publish_state(self, now: float) -> None:
-        payload: dict = self._get_publish_state_payload(now)
+        if not self._mqtt.is_connected:
+            # publish would fail, do not build the payload, the state is published by a later loop after reconnect
+            return
+        payload: str = self._get_publish_state_payload(now)
         _LOGGER.debug("Publishing state for %s with id %s: %s", self.__class__.__name__, self.id, payload)
         if self._mqtt.publish(self.state_topic, payload, retain = True):
             self._published_count = self._count
-            self._published_time = now
+            self._published_time = _monotonic()
 
 
-    def _get_publish_state_payload(self, now: float) -> dict:
-        payload: dict = {
-            "count" : self._count,
-            "timestamp" : utils.format_iso_timestamp_tz(now)
-        }
-        return payload
+    def _get_publish_state_payload(self, now: float) -> str:
+        # returns the payload as json string, invoked with the lock held
+        # the json is formatted directly, values are only numbers and the timestamp which needs no escaping
+        return f'{{"count": {self._count}, "timestamp": {self._get_timestamp_json(now)}}}'
+
+
+    def _get_timestamp_json(self, now: float) -> str:
+        # returns the timestamp as json value, a number for unix timestamps or a string for iso timestamps
+        # iso timestamps are cached per second by format_iso_timestamp_tz
+        return str(int(now)) if self._timestamp_unix else '"' + utils.format_iso_timestamp_tz(now) + '"'
 
 
     def get_discovery_components(self) -> dict[str, dict]:
@@ -216,7 +317,9 @@ class PulseCounter(Device):
                 icon = "mdi:counter", state_class = "total_increasing", value_template = "{{ value_json.count }}"))
         components.update(self.get_discovery_component_config(
                 "sensor", "timestamp", "Timestamp",
-                enabled_by_default = False, device_class = "timestamp", value_template = "{{ value_json.timestamp }}"))
+                enabled_by_default = False, device_class = "timestamp",
+                value_template = "{{ value_json.timestamp | timestamp_local }}" if self._timestamp_unix
+                        else "{{ value_json.timestamp }}"))
         return components
 
 
@@ -227,6 +330,8 @@ class ElectricityPulseMeter(PulseCounter):
     "power" (in W).
     """
 
+    __slots__ = ("_pulses_per_kwh", "_pulse_times", "_append_pulse_time")
+
     def __init__(self, device_config: ConfigParser, mqtt: MqttConnection) -> None:
         """
         Creates an instance from the given device configuration node.
@@ -238,13 +343,11 @@ class ElectricityPulseMeter(PulseCounter):
         super().__init__(device_config, mqtt)
         self._pulses_per_kwh: int = device_config.get_int("pulses_per_kwh", mandatory = True,
                 min_value = 1, max_value = 10_000)
+        self._set_command_handlers["energy"] = self._on_set_energy_message
 
-        self._pulse_time: float = None
-        self._pulse_seconds: float = None
-
-        # factor to calculate power in W from diff_count and diff_seconds
-        # count * pulses_per_kwh => kWh, devide by hours (seconds / 3600), multiply by 1000 (kW -> W)
-        self._power_calc_factor = 3_600_000 / self._pulses_per_kwh
+        # monotonic times in ns of the last two pulses, appended lock free by the sensor callback
+        self._pulse_times: deque[int] = None
+        self._append_pulse_time: Callable[[int], None] = None
 
 
     def get_energy(self) -> float:
@@ -254,7 +357,7 @@ class ElectricityPulseMeter(PulseCounter):
         Returns:
             float: the energy in kWh
         """
-        return round(self.get_count() / self._pulses_per_kwh, 1)
+        return self._calc_energy_tenths(self.get_count()) / 10
 
 
     def set_energy(self, energy: float, now: float = None) -> None:
@@ -269,6 +372,11 @@ class ElectricityPulseMeter(PulseCounter):
         self.set_count(int(energy * self._pulses_per_kwh), now)
 
 
+    def _calc_energy_tenths(self, count: int) -> int:
+        # rounded half up, integer division as replacement of round(count / pulses_per_kwh, 1)
+        return (10 * count + self._pulses_per_kwh // 2) // self._pulses_per_kwh
+
+
     def get_power(self) -> float | None:
         """
         Gets the current power in W. The result is calculated from the time between the last two counted pulses.
@@ -276,45 +384,46 @@ class ElectricityPulseMeter(PulseCounter):
         Returns:
             float | None: the current power in W, None if not available
         """
-        power: float = None
-        if self._pulse_seconds is not None:
-            power = round(self._power_calc_factor / self._pulse_seconds, 1)
-        return power
+        power_tenths: int = self._get_power_tenths()
+        return None if power_tenths is None else power_tenths / 10
 
 
-    def _init_state(self) -> None:
-        self._pulse_time = None
-        self._pulse_seconds = None
-        super()._init_state()
-
+    def _get_power_tenths(self) -> int | None:
+        # snapshot as tuple, the sensor callback may append to the deque at any time
+        pulse_times: tuple[int, ...] = tuple(self._pulse_times)
+        if len(pulse_times) != 2:
+            return None
+        divisor: int = self._pulses_per_kwh * (pulse_times[1] - pulse_times[0])
+        return (_POWER_TENTHS_DIVIDEND + divisor // 2) // divisor if divisor > 0 else None
 
-    def _on_sensor_pulse(self) -> None:
-        with self._lock:
-            super()._on_sensor_pulse()
-            # duration between the last two pulse is used to calculate current power
-            now: float = time.time()
-            if self._pulse_time is None:
-                self._pulse_time = now
-            else:
-                self._pulse_seconds = now - self._pulse_time
-                self._pulse_time = now
 
-
-    def _start_command_handler(self):
-        super()._start_command_handler()
-        self._mqtt.add_message_handler(self.state_topic + "/set/energy", self._on_set_energy_message)
+    def _init_state(self) -> None:
+        self._pulse_times = deque(maxlen = 2)
+        self._append_pulse_time = self._pulse_times.append
+        super()._init_state()
 
 
-    def _stop_command_handler(self):
-        super()._stop_command_handler()
-        self._mqtt.remove_message_handler(self.state_topic + "/set/energy", self._on_set_energy_message)
+    def _create_sensor_callback(self) -> Callable[[], None]:
+        # duration between the last two pulse is used to calculate current power, deque append is thread safe
+        # monotonic time is used to not get wrong durations if the system clock is adjusted
+        # appended before counting the pulse to have the time available when loop sees the pulse
+        count_pulse: Callable[[], None] = super()._create_sensor_callback()
+        append_pulse_time: Callable[[int], None] = self._append_pulse_time
+        monotonic_ns: Callable[[], int] = _monotonic_ns
+        def on_sensor_pulse() -> None:
+            append_pulse_time(monotonic_ns())
+            count_pulse()
+        return on_sensor_pulse
 
 
     def _on_set_energy_message(self, message: mqtt_client.MQTTMessage) -> None:
         _LOGGER.info("Received set energy command message for %s with id %s: %s",
                 self.__class__.__name__, self.id, message.payload)
         try:
-            read_energy: int = int(message.payload.decode())
+            read_energy: float = float(message.payload)
+            if not math.isfinite(read_energy):
+                # float accepts inf and nan, they cannot be converted to a count
+                raise ValueError(f"energy must be a finite number: {read_energy}")
             if read_energy:
                 self.set_energy(read_energy)
         except (ValueError) as error:
@@ -323,13 +432,25 @@ class ElectricityPulseMeter(PulseCounter):
 
 
     def _get_publish_state_payload(self, now):
-        payload: dict = super()._get_publish_state_payload(now)
-        payload["energy"] = self.get_energy()
-        payload["power"] = self.get_power()
-        return payload
+        # formatted in one go instead of extending the base class payload
+        # invoked with the lock held, the (not reentrant) lock must not be acquired again by get_energy
+        # tenths are formatted as decimal number without converting them to float
+        count: int = self._count
+        energy_tenths: int = self._calc_energy_tenths(count)
+        power_tenths: int = self._get_power_tenths()
+        power: str = "null" if power_tenths is None else self._format_tenths(power_tenths)
+        return (f'{{"count": {count}, "timestamp": {self._get_timestamp_json(now)}, '
+                f'"energy": {self._format_tenths(energy_tenths)}, "power": {power}}}')
 
 
-    def get_discovery_components(self):
+    @staticmethod
+    def _format_tenths(tenths: int) -> str:
+        # formats the absolute value to keep the digits of negative values (e.g. set energy) correct
+        quotient, remainder = divmod(abs(tenths), 10)
+        return f"{'-' if tenths < 0 else ''}{quotient}.{remainder}"
+
+
+    def get_discovery_components(self) -> dict[str, dict]:
         components: dict[str, dict] = super().get_discovery_components()
 
         # hide component "count" created by base class
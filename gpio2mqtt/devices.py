@@ -2,7 +2,10 @@
 Base to manage devices.
 """
 from abc import abstractmethod
+from collections.abc import Callable
 import logging
+import re
+from typing import Final
 
 from gpiozero import Device as GpiozeroDevice
 from gpiozero.pins.mock import MockFactory
@@ -10,9 +13,12 @@ from gpiozero.pins.mock import MockFactory
 from . import GPIO2MQTT_VERSION
 from .config import ConfigParser
 from .mqtt import MqttConnection
+from . import utils
 
 _LOGGER = logging.getLogger(__name__)
 
+_ID_PATTERN: Final[re.Pattern[str]] = re.compile("[a-zA-Z0-9_-]+")
+
 
 class HomeAssistantInfo:
     """
@@ -31,11 +37,8 @@ class HomeAssistantInfo:
         """
         self._enabled: bool = ha_config.get_bool("enabled", default = True)
         self._name: str = ha_config.get_str("name", mandatory = self._enabled)
-        self._component_names: dict[str, str] = {}
-        for key in ha_config.raw:
-            if key.endswith("_name"):
-                self._component_names[key[:-5]] = ha_config.get_str(key)
-        print(self._component_names)
+        self._component_names: dict[str, str] = {
+                key[:-5] : ha_config.get_str(key) for key in ha_config.raw if key.endswith("_name") }
 
 
     @property
@@ -76,6 +79,9 @@ class Device():
     Base class for devices.
     """
 
+    __slots__ = ("_id", "_homeassistant", "_mqtt", "_state_topic", "_discovery_payload_json")
+
+
     def __init__(self, device_config: ConfigParser, mqtt: MqttConnection):
         """
         Creates an instance from the given device configuration.
@@ -84,11 +90,12 @@ class Device():
             device_config (ConfigParser): the device configuration
             mqtt (MqttConnection): the mqtt connection
         """
-        self._id: str = device_config.get_str("id", mandatory = True, regex_pattern = "[a-zA-Z0-9_-]+")
+        self._id: str = device_config.get_str("id", mandatory = True, regex_pattern = _ID_PATTERN)
         self._homeassistant: HomeAssistantInfo = HomeAssistantInfo(device_config.get_node_parser("homeassistant"))
 
         self._mqtt = mqtt
         self._state_topic: str = self._mqtt.base_topic + "/" + self.id
+        self._discovery_payload_json: str = None
 
 
     @property
@@ -143,14 +150,16 @@ class Device():
         if self._homeassistant:
             topic: str = self._mqtt.homeassistant_topic + "/device/" + self._mqtt.base_topic + "/" + self.id + "/config"
             if self._homeassistant.enabled:
-                payload: dict = self.get_discovery_payload()
+                # the discovery payload depends on the configuration only, serialize it once
+                if self._discovery_payload_json is None:
+                    self._discovery_payload_json = utils.json_dumps(self.get_discovery_payload())
                 _LOGGER.info("Publishing Home Assistant discovery for %s with id %s: %s",
-                        self.__class__.__name__, self.id, payload)
-                self._mqtt.publish(topic, payload, retain = True)
+                        self.__class__.__name__, self.id, self._discovery_payload_json)
+                self._mqtt.publish(topic, self._discovery_payload_json, retain = True)
             else:
                 _LOGGER.info("Removing Home Assistant discovery for %s with id %s",
                         self.__class__.__name__, self.id)
-                self._mqtt.publish(topic, None, as_json = False, retain = True)
+                self._mqtt.publish(topic, None, retain = True)
 
 
     def get_discovery_payload(self) -> dict:
@@ -212,15 +221,14 @@ class Device():
         Returns:
             dict[str, dict]: _description_
         """
-        object_id: str = self.id + "_" + component_key
-        config: dict = {
+        object_id: str = self._id + "_" + component_key
+        return { component_key : {
             "platform" : platform,
             "object_id" : object_id,
             "unique_id" : object_id,
             "name" : self._homeassistant.get_component_name(component_key, default_name),
-        }
-        config.update(kwargs)
-        return { component_key : config }
+            **kwargs,
+        } }
 
 
 class Devices:
@@ -228,6 +236,9 @@ class Devices:
     Handles the devices.
     """
 
+    __slots__ = ("_device_classes", "_devices", "_loop_functions")
+
+
     def __init__(self, device_classes: list[type[Device]], config: ConfigParser, mqtt: MqttConnection):
         """
         Creates an instance.
@@ -240,6 +251,8 @@ class Devices:
         """
         self._device_classes: dict[str, type[Device]] = { clazz.__name__ : clazz for clazz in device_classes }
         self._devices = self._create_devices(config, mqtt)
+        # bound once, loop is invoked from the main loop for every tick
+        self._loop_functions: tuple[Callable[[], None], ...] = tuple(device.loop for device in self._devices)
 
 
     def start(self) -> None:
@@ -263,8 +276,8 @@ class Devices:
         """
         Main loop callback for devices. Allows devices to do something periodically.
         """
-        for device in self._devices:
-            device.loop()
+        for loop_function in self._loop_functions:
+            loop_function()
 
 
     @property
@@ -286,7 +299,7 @@ class Devices:
 
     def _create_devices(self, config: ConfigParser, mqtt: MqttConnection) -> list[Device]:
         device_configs: list[ConfigParser] = config.get_list_parsers("devices", _LOGGER)
-        known_types: set[str] = set(self._device_classes.keys())
+        known_types: frozenset[str] = frozenset(self._device_classes.keys())
         ids: set[str] = set()
         devices: list[Device] = []
         for device_config in device_configs:
@@ -3,24 +3,43 @@ MQTT broker connection.
 """
 from collections.abc import Callable
 from hashlib import sha1
-import json
 import logging
+import socket
+from typing import Final, NamedTuple
 
 import paho.mqtt.client as mqtt_client
 
 from .config import ConfigParser
+from . import utils
 
 _LOGGER = logging.getLogger(__name__)
 
+# the bridge state payloads never change, serialized once
+_BRIDGE_STATE_ONLINE: Final[str] = utils.json_dumps({ "state" : "online" })
+_BRIDGE_STATE_OFFLINE: Final[str] = utils.json_dumps({ "state" : "offline" })
+
 
 MqttConnectionOnMessage = Callable[[mqtt_client.MQTTMessage], None]
 
 
+class _MqttClientSettings(NamedTuple):
+    # connection settings, kept until the mqtt client is created on start
+    host: str
+    port: int
+    client_id: str
+    user: str
+    password: str
+
+
 class MqttConnection:
     """
     Handles the connection with the MQTT broker.
     """
 
+    __slots__ = ("_client_settings", "_base_topic", "_homeassistant_topic",
+            "_client", "_message_handlers", "_bridge_state_topic")
+
+
     def __init__(self, config: ConfigParser):
         """Creates an instance.
 
@@ -28,8 +47,8 @@ class MqttConnection:
             config (ConfigParser): the application configuration
         """
         mqtt_config: ConfigParser = config.get_node_parser("mqtt", _LOGGER)
-        self._host = mqtt_config.get_str("host", mandatory = True)
-        self._port = mqtt_config.get_int("port", mandatory = True, default = 1883, min_value = 1, max_value = 65535)
+        host: str = mqtt_config.get_str("host", mandatory = True)
+        port: int = mqtt_config.get_int("port", mandatory = True, default = 1883, min_value = 1, max_value = 65535)
         user: str = mqtt_config.get_str("user", mandatory = True)
         password: str = mqtt_config.get_str("password", mandatory = True)
         client_id: str = mqtt_config.get_str("client_id")
@@ -39,19 +58,13 @@ class MqttConnection:
 
         if not client_id:
             client_id = "gpio2mqtt-" + sha1(self._base_topic.encode("utf8")).hexdigest()
+        self._client_settings = _MqttClientSettings(host, port, client_id, user, password)
 
-        # configure mqtt client but do not connect now
-        self._client: mqtt_client.Client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, client_id)
-        self._client.username = user
-        self._client.password = password
-        self._client.on_connect = self._on_connect
-        self._client.on_disconnect = self._on_disconnect
-        self._client.on_message = self._on_message
-
-        self._message_handlers: dict[str, set[MqttConnectionOnMessage]] = {}
+        # the mqtt client is created on start, validating the configuration does not need it
+        self._client: mqtt_client.Client = None
+        # handler tuples are replaced instead of modified, on message iterates them without copy
+        self._message_handlers: dict[str, tuple[MqttConnectionOnMessage, ...]] = {}
         self._bridge_state_topic: str = self._base_topic + "/bridge/state"
-        self._client.will_set(self._bridge_state_topic, self._get_bridge_state_payload_str(False),
-                qos = 0, retain = True)
 
 
     @property
@@ -81,6 +94,15 @@ class MqttConnection:
         return self._bridge_state_topic
 
 
+    @property
+    def is_connected(self) -> bool:
+        """
+        Returns:
+            bool: True if connected to the MQTT broker, False otherwise
+        """
+        return self._client is not None and self._client.is_connected()
+
+
     def start(self) -> bool:
         """
         Connects to the MQTT broker and starts the network loop.
@@ -88,14 +110,16 @@ class MqttConnection:
         Returns:
             bool: True if successful, False otherwise
         """
-        _LOGGER.info("Connecting to MQTT broker %s:%d", self._host, self._port)
-        error_code: mqtt_client.MQTTErrorCode = self._client.connect(self._host, self._port)
+        self._client = self._create_client()
+        host, port = self._client_settings.host, self._client_settings.port
+        _LOGGER.info("Connecting to MQTT broker %s:%d", host, port)
+        error_code: mqtt_client.MQTTErrorCode = self._client.connect(host, port)
         result: bool = error_code == mqtt_client.MQTTErrorCode.MQTT_ERR_SUCCESS
         if result:
             self._client.loop_start()
         else:
             _LOGGER.critical("Connection to MQTT broker %s:%d failed: error_code=%s",
-                    self._host, self._port, error_code)
+                    host, port, error_code)
         return result
 
 
@@ -103,31 +127,27 @@ class MqttConnection:
         """
         Stops the network loop and disconnects from the MQTT broker. Does nothing if not connected.
         """
-        if self._client.is_connected():
+        if self.is_connected:
             _LOGGER.info("Disconnecting from MQTT broker")
-            self.publish(self._bridge_state_topic, self._get_bridge_state_payload_str(False),
-                    as_json = False, retain = True)
+            self.publish(self._bridge_state_topic, _BRIDGE_STATE_OFFLINE, retain = True)
             self._client.loop_stop()
             self._client.disconnect()
 
 
-    def publish(self, topic: str, payload: any, as_json: bool = True, qos: int = 0, retain: bool = False) -> bool:
+    def publish(self, topic: str, payload: str | bytes | None, qos: int = 0, retain: bool = False) -> bool:
         """
         Publishes the given payload to the given topic.
+        The payload is published as-is, json payloads must already be serialized (see utils.json_dumps).
 
         Args:
             topic (str): the topic (absolute, including the base topic)
-            payload (any): the message to send
-            as_json (bool):
-                    True to serialize the given payload as json before publish, False to publish the payload as-is
+            payload (str | bytes | None): the message to send
             qos (int, optional): the quality of service level
             retain (bool, optional): True to send a retained message, False otherwise
         Returns:
             bool: True if successful, False otherwise
         """
         _LOGGER.debug("Publishing message to %s: %s", topic, payload)
-        if as_json:
-            payload = json.dumps(payload)
         info: mqtt_client.MQTTMessageInfo = self._client.publish(topic, payload, qos = qos, retain = retain)
         return info.rc == mqtt_client.MQTTErrorCode.MQTT_ERR_SUCCESS
 
@@ -135,6 +155,7 @@ class MqttConnection:
     def add_message_handler(self, topic: str, handler: MqttConnectionOnMessage) -> None:
         """
         Adds the given handler for messages of the given topic.
+        The topic may end with the single level wildcard "+" (like "a/b/+") to receive the messages of all sub topics.
 
         Args:
             topic (str): the topic to subscribe
@@ -142,13 +163,12 @@ class MqttConnection:
         """
         handlers = self._message_handlers.get(topic)
         if handlers is None:
-            handlers = { handler }
-            self._message_handlers[topic] = handlers
-            if self._client.is_connected():
+            self._message_handlers[topic] = (handler,)
+            if self.is_connected:
                 _LOGGER.info("Subscribing to topic %s", topic)
                 self._client.subscribe(topic)
-        else:
-            handlers.add(handler)
+        elif handler not in handlers:
+            self._message_handlers[topic] = handlers + (handler,)
 
 
     def remove_message_handler(self, topic: str, handler: MqttConnectionOnMessage) -> None:
@@ -160,27 +180,51 @@ class MqttConnection:
             handler (MqttConnectionOnMessage): the on message handler callback
         """
         handlers = self._message_handlers.get(topic)
-        if handlers:
-            handlers.discard(handler)
-            if not handlers and self._client.is_connected:
-                _LOGGER.info("Unsubscribing from topic %s", topic)
-                # unsubscribe after removing last handler for a topic
-                self._client.unsubscribe(topic)
-
-
-    def _get_bridge_state_payload_str(self, online: bool) -> str:
-        payload: dict = { "state" : "online" if online else "offline" }
-        return json.dumps(payload)
+        if handlers and handler in handlers:
+            handlers = tuple(other for other in handlers if other != handler)
+            if handlers:
+                self._message_handlers[topic] = handlers
+            else:
+                del self._message_handlers[topic]
+                if self.is_connected:
+                    _LOGGER.info("Unsubscribing from topic %s", topic)
+                    # unsubscribe after removing last handler for a topic
+                    self._client.unsubscribe(topic)
+
+
+    def _create_client(self) -> mqtt_client.Client:
+        # configure mqtt client but do not connect now
+        settings: _MqttClientSettings = self._client_settings
+        client: mqtt_client.Client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, settings.client_id)
+        client.username = settings.user
+        client.password = settings.password
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.on_socket_open = self._on_socket_open
+        client.will_set(self._bridge_state_topic, _BRIDGE_STATE_OFFLINE, qos = 0, retain = True)
+        return client
+
+
+    def _on_socket_open(self, client: mqtt_client.Client, userdata, sock: socket.socket):
+        # pylint: disable=unused-argument
+        # invoked for each (re)connect, disable nagle to send the small mqtt packets without delay
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError) as error:
+            _LOGGER.debug("Disabling nagle algorithm failed: %s", error)
 
 
     def _on_connect(self, client: mqtt_client.Client, userdata, connect_flags, reason_code, properties):
         # pylint: disable=unused-argument
         _LOGGER.debug("Connected with reason code %s", reason_code)
-        self.publish(self._bridge_state_topic, self._get_bridge_state_payload_str(True), as_json = False, retain = True)
-        # (re)subscribe to topics with added handlers
-        for topic in self._message_handlers:
-            _LOGGER.info("Subscribing to topic %s", topic)
-            self._client.subscribe(topic)
+        self.publish(self._bridge_state_topic, _BRIDGE_STATE_ONLINE, retain = True)
+        # (re)subscribe to topics with added handlers, all topics with a single subscribe packet
+        # copy the topics as handlers may be removed concurrently
+        topics: tuple[str, ...] = tuple(self._message_handlers)
+        if topics:
+            _LOGGER.info("Subscribing to topics %s", ", ".join(topics))
+            self._client.subscribe([ (topic, 0) for topic in topics ])
 
 
     def _on_disconnect(self, client: mqtt_client.Client, userdata, disconnect_flags, reason_code, properties):
@@ -190,9 +234,14 @@ class MqttConnection:
 
     def _on_message(self, client: mqtt_client.Client, userdata, message: mqtt_client.MQTTMessage):
         # pylint: disable=unused-argument
-        _LOGGER.debug("Received message on topic %s: %s", message.topic, str(message.payload))
+        _LOGGER.debug("Received message on topic %s: %s", message.topic, message.payload)
+        # handler tuples are immutable, handlers may remove subscriptions while iterating
         handlers = self._message_handlers.get(message.topic)
         if handlers:
-            # iterate over copy to allow that handlers remove subscriptions
-            for handler in handlers.copy():
+            for handler in handlers:
+                handler(message)
+        # handlers subscribed with a trailing single level wildcard
+        handlers = self._message_handlers.get(message.topic.rpartition("/")[0] + "/+")
+        if handlers:
+            for handler in handlers:
                 handler(message)
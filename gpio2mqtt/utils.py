@@ -1,26 +1,75 @@
 """
 Utilities.
 """
+from datetime import datetime
+import json
 import time
 from typing import Final
 
+# orjson is optional, it is much faster than the json module of the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 ISO_FORMAT_TIMESTAMP_TZ: Final[str] = "%Y-%m-%dT%H:%M:%S%z"
 
+# created once, json.dumps creates a new encoder for each call with non default arguments
+# compact and not ascii escaped to create the same output as orjson
+_json_encode = json.JSONEncoder(separators = (",", ":"), ensure_ascii = False).encode
+
+# last formatted iso timestamp and its second, shared by all devices publishing within the same second
+# stored as one tuple to be replaced atomically, formatting may be invoked from different threads
+_last_iso_timestamp: tuple[int, str] = (None, None)
+
+
+def json_dumps(obj: any) -> str:
+    """
+    Serializes the given object as json string. Uses orjson if available.
+
+    Args:
+        obj (any): the object to serialize
+    Returns:
+        str: the json string
+    """
+    return orjson.dumps(obj).decode() if orjson else _json_encode(obj)
+
+
+def json_loads(data: bytes | str) -> any:
+    """
+    Deserializes the given json string or bytes. Uses orjson if available.
+    If the data is not valid json, json.JSONDecodeError (a subclass of ValueError) is raised.
+
+    Args:
+        data (bytes | str): the json string or bytes
+    Returns:
+        any: the deserialized object
+    """
+    return orjson.loads(data) if orjson else json.loads(data)
+
 
 def format_iso_timestamp_tz(seconds: float) -> str:
     """
     Formats the given time in seconds since epoch as a iso timestamp string with time zone.
     Returns None if the given time is empty.
+    The local time zone is not cached, its offset changes with daylight saving time.
+    The result for the last second is cached, the formatted timestamp has second precision.
 
     Args:
         seconds (float): the time in seconds since epoch
     Returns:
         str: the iso timestamp string with time zone
     """
+    # pylint: disable=global-statement
+    global _last_iso_timestamp
     result: str = None
     if seconds:
-        result = time.strftime(ISO_FORMAT_TIMESTAMP_TZ, time.localtime(seconds))
+        second: int = int(seconds)
+        last_second, result = _last_iso_timestamp
+        if second != last_second:
+            result = time.strftime(ISO_FORMAT_TIMESTAMP_TZ, time.localtime(second))
+            _last_iso_timestamp = (second, result)
     return result
 
 
@@ -37,5 +86,6 @@ def parse_iso_timestamp_tz(string: str) -> float:
     """
     result: float = None
     if string:
-        result = time.mktime(time.strptime(string, ISO_FORMAT_TIMESTAMP_TZ))
+        # fromisoformat is implemented in C and, unlike mktime, respects the time zone offset of the string
+        result = datetime.fromisoformat(string).timestamp()
     return result